@@ -7,7 +7,40 @@ class BaseDecoder(ABC):
         pass
 
     @abstractmethod
-    async def generate_full_trace(self, prompt: str, max_steps: int, temperature: float, top_p: float, top_k: int, decoding_strategy: str):
-        """Generate a trace of decoding steps."""
+    def tokenize(self, prompt: str) -> list:
+        """Return the token ids for `prompt`."""
+        pass
+
+    @abstractmethod
+    def decode_delta(self, path_ids: list, token_id: int) -> str:
+        """Return the text appending `token_id` adds after the token ids `path_ids`.
+
+        Must match how stream_trace builds each step's "chosen_token", so a
+        branched step renders the same as a generated one.
+        """
         pass
 
+    @abstractmethod
+    async def stream_trace(self, prompt_tokens: list, max_steps: int, temperature: float, top_p: float, top_k: int, decoding_strategy: str,
+                           cached_prefix_len: int = 0, cache_handle=None):
+        """Yield decoding steps one at a time as they are produced.
+
+        Each step is a dict with these required keys:
+          "top_tokens": candidates as {"token": str, "prob": float, "id": int}
+          "chosen_token": text the chosen token adds to the sequence
+          "token_id": id of the chosen token
+        and optionally "cache_handle" and "step_time" (compute seconds).
+
+        `cache_handle` is an opaque value taken from the "cache_handle" key of a
+        previous step; when `cached_prefix_len` > 0 the decoder may reuse it to
+        skip prefill for the first `cached_prefix_len` prompt tokens shared with
+        that earlier run.
+        """
+        yield
+
+    async def generate_full_trace(self, prompt: str, max_steps: int, temperature: float, top_p: float, top_k: int, decoding_strategy: str,
+                                  cached_prefix_len: int = 0, cache_handle=None):
+        """Generate a trace of decoding steps."""
+        return [step async for step in self.stream_trace(self.tokenize(prompt), max_steps, temperature, top_p, top_k, decoding_strategy,
+                                                         cached_prefix_len, cache_handle)]
+
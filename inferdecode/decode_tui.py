@@ -1,29 +1,148 @@
+from textual import on
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal
 from textual.widgets import Input, Button, Static, Select
+from textual.validation import Integer, Number
 from textual.worker import Worker, get_current_worker, WorkerCancelled
 from textual.message import Message
 import asyncio
+import struct
 import time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain, takewhile
 from rich.panel import Panel
+from rich.style import Style
 from rich.text import Text
 
+# Prompt KV-cache handles kept for reuse; each pins the model's attention states for one prompt
+_KV_CACHE_SIZE = 4
+
+# Recurrence penalty applied per previous visit when auto-picking a branch: p * (1 - gamma) ** visits
+_RECURRENCE_PENALTY = 0.3
+
+# Top-ranked alternatives for one step, kept as parallel arrays rather than a dict per candidate
+class TopCandidates:
+    __slots__ = ("tokens", "_probs", "ids")
+
+    def __init__(self, tokens=(), probs=(), ids=()):
+        self.tokens = tuple(tokens)
+        # Packed as float16 (~3 significant digits): enough for a 30-cell bar and a 3-decimal readout
+        self._probs = struct.pack(f"{len(self.tokens)}e", *probs)
+        self.ids = array("q", ids)
+
+    @property
+    def probs(self):
+        return struct.unpack(f"{len(self.tokens)}e", self._probs)
+
+    @classmethod
+    def from_dicts(cls, top_tokens):
+        """Build from the model's list of {"token", "prob", "id"} dicts."""
+        return cls([t["token"] for t in top_tokens],
+                   [t["prob"] for t in top_tokens],
+                   [t["id"] for t in top_tokens])
+
+    def __len__(self):
+        return len(self.tokens)
+
+_NO_CANDIDATES = TopCandidates()
+
+# A decoded step in the trace tree; children are alternate continuations keyed by token id
+class TokenNode:
+    def __init__(self, parent=None, token=None, candidates=_NO_CANDIDATES, token_id=None, prompt=""):
+        self.parent = parent
+        self.token = token
+        self.token_id = token_id
+        self.children = {}
+        self.candidates = candidates
+        self.prompt = prompt  # Only meaningful on the root
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.active_child = None  # Child followed by Start/Step when moving forward
+        self.terminal = False  # Set once the model stopped producing steps after this node
+        self.visits = 0
+
+    @property
+    def current_text(self):
+        """Prompt followed by the tokens chosen along the path to this node."""
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.token)
+            node = node.parent
+        parts.append(node.prompt)
+        return "".join(reversed(parts))
+
+    def add_child(self, token_id, token, candidates):
+        """Return the child for `token_id`, creating it if needed, and make it the active branch."""
+        child = self.children.get(token_id)
+        if child is None:
+            child = TokenNode(self, token, candidates, token_id)
+            self.children[token_id] = child
+        self.active_child = child
+        return child
+
 # Custom message to update the UI with each token
 class TokenUpdate(Message):
-    def __init__(self, step_info, cur_pos, total_steps, total_time, avg_time_per_token):
+    def __init__(self, node, cur_pos, total_steps, total_time, avg_time_per_token):
         super().__init__()
-        self.step_info = step_info
+        self.node = node
         self.cur_pos = cur_pos
         self.total_steps = total_steps
         self.total_time = total_time
         self.avg_time_per_token = avg_time_per_token
 
+# Numeric settings inputs: id -> (parser, value used when the field is empty)
+_SETTING_INPUTS = {
+    "top_p": (float, 0.9),
+    "top_k": (int, 40),
+    "temperature": (float, 1.0),
+    "max_steps": (int, 64),
+    "delay": (float, 0.3),
+}
+
+def _common_prefix_len(a, b):
+    """Number of leading token ids shared by two sequences."""
+    return sum(1 for _ in takewhile(lambda pair: pair[0] == pair[1], zip(a, b)))
+
+# Parsed once so renders don't go through Rich's style-string parser
+_CYAN = Style(color="cyan")
+_GREEN = Style(color="green")
+_MAGENTA = Style(color="magenta")
+_BOLD_BLUE = Style(color="blue", bold=True)
+_BOLD_GREEN = Style(color="green", bold=True)
+
+# Pre-padded probability bars indexed by width (0..30)
+_BARS = tuple(("█" * i).ljust(30) for i in range(31))
+
+@lru_cache(maxsize=256)
+def _render_tokens_panel(tokens, probs, max_prob):
+    """Build the Top Candidates panel from parallel tuples of tokens and probabilities."""
+    # One assemble call over all runs; adjacent unstyled pieces are pre-joined per row
+    rows = (
+        (f"{rank:>2} ", (token.ljust(12), _BOLD_BLUE),
+         f" | {_BARS[min(int(prob / max_prob * 30), 30)]} {prob:.3f}\n")
+        for rank, (token, prob) in enumerate(zip(tokens, probs), start=1)
+    )
+    token_text = Text.assemble(*chain.from_iterable(rows), justify="left")
+    return Panel(token_text, title="Top Candidates", border_style=_CYAN)
+
+# Keyed by node, not text: a few entries cover stepping back and forth without holding
+# a full-text snapshot for every step of a long run
+@lru_cache(maxsize=8)
+def _render_generated_panel(node):
+    """Build the Generated Text panel for a trace node."""
+    return Panel(Text(node.current_text, style=_BOLD_GREEN),
+                 title="Generated Text", border_style=_GREEN)
+
 class DecodeTUI(App):
     CSS = """ 
     Screen { layout: vertical; align: center top; padding: 1; }
     #settings_bar, #buttons_bar { layout: horizontal; height: auto; align: center top; padding: 1; }
     #visuals { layout: horizontal; align: center top; height: 1fr; width: 100%; margin-top: 2; }
     .small_input, .small_button { width: 12%; height: 3; margin: 0 1; }
+    #buttons_bar .small_button { width: auto; min-width: 0; }
+    #branch_rank { width: 10; }
     .prompt_input { width: 100%; height: 3; margin: 1 1; }
     #tokens, #generated, #metrics { border: heavy $accent; padding: 1; width: 1fr; height: 1fr; }
     """
@@ -31,6 +150,9 @@ class DecodeTUI(App):
     def __init__(self, model, **kwargs):
         super().__init__(**kwargs)
         self.model = model
+        # Prompts are often re-run unchanged or lightly edited, so keep recent tokenizations
+        self._tokenize = lru_cache(maxsize=32)(model.tokenize)
+        self._prompt_tokens = []
         self.prompt = ""
         self.decoding_strategy = "greedy"
         self.top_p = 0.9
@@ -38,9 +160,12 @@ class DecodeTUI(App):
         self.temperature = 1.0
         self.max_steps = 64
         self.delay = 0.3
+        # Minimum wall-clock time between two TokenUpdate renders during a full run
+        self._flush_interval = 0.05
 
-        self.trace = []
-        self.cur_pos = 0
+        # Root node holds the prompt; cur_node is the step currently shown
+        self.trace_root = None
+        self.cur_node = None
         self.finished = False
         self.stop_requested = False
         self.total_time = 0
@@ -48,6 +173,23 @@ class DecodeTUI(App):
         self.trace_prompt = None
         self.paused = False
         self.worker = None
+        self._pending_cancel_task = None
+        # Async iterator of steps continuing _stream_tail, None when no stream is open
+        self._stream = None
+        self._stream_tail = None
+        self._stream_lock = None
+        self._steps_generated = 0
+        # Recent opaque KV-cache handles from the model, keyed by the prompt token ids they were built from
+        self._kv_cache = OrderedDict()
+        # Key the open stream's handle will be stored under; cleared once it has been stored
+        self._stream_kv_key = None
+        # Last valid value typed into each settings input, applied when a new trace starts
+        self._settings = {name: default for name, (_, default) in _SETTING_INPUTS.items()}
+        self._invalid_settings = set()
+        # Run-constant metrics lines and the panel they are shown in, reused across updates
+        self._metrics_static = ""
+        self._metrics_box = Panel("", title="Metrics 📈", border_style=_MAGENTA)
+        self._last_rendered_node = None
 
     def compose(self) -> ComposeResult:
         with Horizontal(id="settings_bar"):
@@ -64,24 +206,56 @@ class DecodeTUI(App):
                 id="strategy",
                 classes="small_input"
             )
-            yield Input(placeholder="Top-p (0.9)", id="top_p", classes="small_input")
-            yield Input(placeholder="Top-k (40)", id="top_k", classes="small_input")
-            yield Input(placeholder="Temp (1.0)", id="temperature", classes="small_input")
-            yield Input(placeholder="Steps (64)", id="max_steps", classes="small_input")
-            yield Input(placeholder="Delay (0.3s)", id="delay", classes="small_input")
+            yield Input(placeholder="Top-p (0.9)", id="top_p", classes="small_input",
+                        validators=[Number(minimum=0, maximum=1)], valid_empty=True)
+            yield Input(placeholder="Top-k (40)", id="top_k", classes="small_input",
+                        validators=[Integer(minimum=1)], valid_empty=True)
+            yield Input(placeholder="Temp (1.0)", id="temperature", classes="small_input",
+                        validators=[Number(minimum=0)], valid_empty=True)
+            yield Input(placeholder="Steps (64)", id="max_steps", classes="small_input",
+                        validators=[Integer(minimum=1)], valid_empty=True)
+            yield Input(placeholder="Delay (0.3s)", id="delay", classes="small_input",
+                        validators=[Number(minimum=0)], valid_empty=True)
 
         yield Input(placeholder="Enter your prompt here...", id="prompt", classes="prompt_input")
 
         with Horizontal(id="buttons_bar"):
             yield Button("Start ➡️", id="start", classes="small_button")
             yield Button("Step ⬇️", id="step", classes="small_button")
+            yield Button("Back ⬆️", id="back", classes="small_button")
             yield Button("Stop ⏹", id="stop", classes="small_button")
+            yield Input(placeholder="Alt #", id="branch_rank", classes="small_input")
+            yield Button("Branch 🔀", id="branch", classes="small_button")
 
         with Horizontal(id="visuals"):
             yield Static("Top Candidates", id="tokens")
             yield Static("Generated Text", id="generated")
             yield Static("Metrics 📈", id="metrics")
 
+    def on_mount(self) -> None:
+        # Resolve widgets once instead of running a selector query on every update
+        self._tokens_panel = self.query_one("#tokens", Static)
+        self._gen_panel = self.query_one("#generated", Static)
+        self._metrics_panel = self.query_one("#metrics", Static)
+        self._prompt_input = self.query_one("#prompt", Input)
+        self._strategy_select = self.query_one("#strategy", Select)
+        self._branch_rank_input = self.query_one("#branch_rank", Input)
+
+    @on(Input.Changed, "#top_p, #top_k, #temperature, #max_steps, #delay")
+    def on_setting_changed(self, event: Input.Changed) -> None:
+        """Parse a settings input as it is edited; the Input's validators flag bad entries."""
+        name = event.input.id
+        parse, default = _SETTING_INPUTS[name]
+        try:
+            if event.validation_result is not None and not event.validation_result.is_valid:
+                raise ValueError(event.value)
+            # Older Integer validators accept e.g. "10.0", which int() rejects
+            self._settings[name] = parse(event.value) if event.value else default
+        except ValueError:
+            self._invalid_settings.add(name)
+        else:
+            self._invalid_settings.discard(name)
+
     async def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "start":
             self.stop_requested = False
@@ -90,46 +264,67 @@ class DecodeTUI(App):
             self.stop_requested = False
             await self.start_decoding(full_run=False)
         elif event.button.id == "stop":
-            self.stop_requested = True
-            if self.worker and not self.worker.is_cancelled:
-                self.worker.cancel()
-                try:
-                    await self.worker.wait()  # Wait for the worker to fully stop
-                except WorkerCancelled:
-                    pass  # Ignore the cancellation exception
-                self.finished = True  # Mark as finished to prevent further generation
+            await self.stop_worker()
+        elif event.button.id == "back":
+            await self.stop_worker()
+            self.step_back()
+        elif event.button.id == "branch":
+            await self.stop_worker()
+            value = self._branch_rank_input.value.strip()
+            if value and not value.isdecimal():
+                self.notify("Alt # must be a whole number", severity="error")
+                return
+            self.branch(int(value) - 1 if value else None)
+
+    async def stop_worker(self):
+        """Stop a running full generation, keeping the explored tree."""
+        self.stop_requested = True
+        if self.worker and not self.worker.is_cancelled:
+            self.worker.cancel()
+            # Let cancellation finish in the background instead of blocking the button handler
+            self._pending_cancel_task = asyncio.create_task(self._drain_worker(self.worker))
+
+    async def _drain_worker(self, worker):
+        """Wait for a cancelled worker to wind down."""
+        try:
+            await worker.wait()
+        except WorkerCancelled:
+            pass  # Ignore the cancellation exception
 
     async def start_decoding(self, full_run=False):
-        current_prompt = self.query_one("#prompt", Input).value
-        if (self.trace_prompt != current_prompt) or not self.trace or self.finished:
-            # Generate new trace
+        current_prompt = self._prompt_input.value
+        if (self.trace_prompt != current_prompt) or self.trace_root is None or self.finished:
+            if self._invalid_settings:
+                self.notify(f"Fix invalid settings: {', '.join(sorted(self._invalid_settings))}",
+                            severity="error")
+                return
+            # Start a new trace tree; steps are streamed lazily from the model
+            if self.worker is not None:
+                self.worker.cancel()
+            await self._close_stream()
             self.trace_prompt = current_prompt
             self.prompt = current_prompt
-            self.decoding_strategy = self.query_one("#strategy", Select).value
-            self.top_p = float(self.query_one("#top_p", Input).value or 0.9)
-            self.top_k = int(self.query_one("#top_k", Input).value or 40)
-            self.temperature = float(self.query_one("#temperature", Input).value or 1.0)
-            self.max_steps = int(self.query_one("#max_steps", Input).value or 64)
-            self.delay = float(self.query_one("#delay", Input).value or 0.3)
-
-            self.cur_pos = 0
+            self._prompt_tokens = self._tokenize(current_prompt)
+            self.decoding_strategy = self._strategy_select.value
+            self.top_p = self._settings["top_p"]
+            self.top_k = self._settings["top_k"]
+            self.temperature = self._settings["temperature"]
+            self.max_steps = self._settings["max_steps"]
+            self.delay = self._settings["delay"]
+            self._metrics_static = f"Model: {self.model.model_name}\nStrategy: {self.decoding_strategy}\n"
+
+            self.trace_root = TokenNode(prompt=self.prompt)
+            self.cur_node = self.trace_root
             self.finished = False
             self.paused = False
             self.stop_requested = False
-
-            start_time = time.time()
-            self.trace = await self.model.generate_full_trace(
-                prompt=self.prompt,
-                max_steps=self.max_steps,
-                temperature=self.temperature,
-                top_p=self.top_p,
-                top_k=self.top_k,
-                decoding_strategy=self.decoding_strategy
-            )
-            self.total_time = time.time() - start_time
-            self.avg_time_per_token = self.total_time / max(1, len(self.trace))
+            self.total_time = 0
+            self.avg_time_per_token = 0
+            self._steps_generated = 0
+            self._stream_tail = None
+            self._stream_lock = asyncio.Lock()
         else:
-            # Continue existing trace
+            # Continue from the current node
             self.stop_requested = False
             self.paused = False
 
@@ -139,74 +334,242 @@ class DecodeTUI(App):
         else:
             await self.decode_one_token()
 
+    async def _close_stream(self):
+        """Drop the current stream, closing it now unless a step is still being pulled from it."""
+        stream, self._stream = self._stream, None
+        # A stream mid-step belongs to a cancelled worker, whose cancellation closes it
+        if stream is not None and not stream.ag_running:
+            await stream.aclose()
+
+    async def _open_stream(self, node):
+        """Start streaming model steps that continue the text at `node`."""
+        await self._close_stream()
+        remaining = self.max_steps - node.depth
+        if remaining <= 0:
+            node.terminal = True
+            return
+        prompt_tokens = self._node_tokens(node)
+        # Reuse the cached prompt sharing the most leading tokens with this one
+        cache_handle, cached_prefix_len = None, 0
+        for cache_tokens, handle in self._kv_cache.items():
+            shared = _common_prefix_len(cache_tokens, prompt_tokens)
+            if shared > cached_prefix_len:
+                cache_handle, cached_prefix_len = handle, shared
+        self._stream_tail = node
+        self._stream_kv_key = tuple(prompt_tokens)
+        self._stream = self.model.stream_trace(
+            prompt_tokens=prompt_tokens,
+            max_steps=remaining,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            top_k=self.top_k,
+            decoding_strategy=self.decoding_strategy,
+            cached_prefix_len=cached_prefix_len,
+            cache_handle=cache_handle
+        )
+
+    async def _next_step(self):
+        """Return the node after cur_node, following the active branch or pulling it from the model."""
+        async with self._stream_lock:
+            node = self.cur_node
+            if node.active_child is not None:
+                return node.active_child
+            if node.terminal:
+                return None
+            if self._stream is None or self._stream_tail is not node:
+                await self._open_stream(node)
+                if self._stream is None:
+                    return None
+            stream = self._stream
+            start_time = time.perf_counter()
+            try:
+                step_info = await stream.__anext__()
+            except StopAsyncIteration:
+                node.terminal = True
+                if self._stream is stream:
+                    self._stream = None
+                return None
+            except BaseException:
+                # A stream that raised or was cancelled cannot be resumed; reopen it from the tail next time.
+                # A new trace may already have replaced it, so only clear our own.
+                if self._stream is stream:
+                    self._stream = None
+                raise
+            # Prefer the model's own compute time; a threaded model may have run ahead of us
+            step_time = step_info.get("step_time")
+            self.total_time += step_time if step_time is not None else time.perf_counter() - start_time
+            self._steps_generated += 1
+            self.avg_time_per_token = self.total_time / self._steps_generated
+            cache_handle = step_info.get("cache_handle")
+            if cache_handle is not None and self._stream_kv_key is not None:
+                self._remember_kv(self._stream_kv_key, cache_handle)
+                self._stream_kv_key = None
+            child = node.add_child(step_info["token_id"], step_info["chosen_token"],
+                                   TopCandidates.from_dicts(step_info["top_tokens"]))
+            self._stream_tail = child
+            return child
+
+    def _remember_kv(self, key, cache_handle):
+        """Keep `cache_handle` as the newest cached prompt, evicting the oldest beyond the limit."""
+        self._kv_cache[key] = cache_handle
+        self._kv_cache.move_to_end(key)
+        while len(self._kv_cache) > _KV_CACHE_SIZE:
+            self._kv_cache.popitem(last=False)
+
+    def _node_tokens(self, node):
+        """Prompt token ids followed by the ids chosen along the path to `node`."""
+        path = []
+        while node.parent is not None:
+            path.append(node.token_id)
+            node = node.parent
+        path.reverse()
+        return list(self._prompt_tokens) + path
+
+    def _move_to(self, node):
+        """Make `node` the current step and record the visit."""
+        self.cur_node = node
+        node.visits += 1
+
+    def _post_node(self, node):
+        self.post_message(TokenUpdate(node, node.depth - 1, self.max_steps,
+                                    self.total_time, self.avg_time_per_token))
+
     async def run_full_generation(self):
         """Worker method to run the generation loop."""
         worker = get_current_worker()
-        while not self.finished and not self.stop_requested and self.cur_pos < len(self.trace):
+        # Coalesce steps so the UI renders at most once per flush interval
+        last_flush = time.monotonic() - self._flush_interval
+        dirty = False  # Advanced past the last rendered step
+        # Pace steps against a deadline so time spent generating/rendering counts toward the delay
+        next_deadline = time.monotonic()
+        while not self.finished and not self.stop_requested:
             if worker.is_cancelled:
                 break  # Exit immediately if canceled
-            step_info = self.trace[self.cur_pos]
-            self.post_message(TokenUpdate(step_info, self.cur_pos, len(self.trace), 
-                                        self.total_time, self.avg_time_per_token))
-            self.cur_pos += 1
-            if self.cur_pos >= len(self.trace):
+            node = await self._next_step()
+            if self.stop_requested:
+                break  # Stop was pressed while the step was computing; leave cur_node alone
+            if node is None:
+                self.finished = True
+                break
+            self._move_to(node)
+            dirty = True
+            if node.terminal:
                 self.finished = True
-            await asyncio.sleep(self.delay)
+            now = time.monotonic()
+            if self.finished or now - last_flush >= self._flush_interval:
+                self._post_node(node)
+                dirty = False
+                last_flush = now
+            # Don't build up a backlog to burst through after a slow step
+            next_deadline = max(next_deadline + self.delay, now)
+            await asyncio.sleep(max(0.0, next_deadline - time.monotonic()))
+        if dirty:
+            # Render the steps advanced since the last flush before stopping
+            self._post_node(self.cur_node)
 
     async def decode_one_token(self):
         """Process a single token for the Step button."""
-        if self.finished or self.cur_pos >= len(self.trace) or self.stop_requested:
+        if self.finished or self.stop_requested:
             self.finished = True
             return
-        step_info = self.trace[self.cur_pos]
-        self.post_message(TokenUpdate(step_info, self.cur_pos, len(self.trace), 
-                                    self.total_time, self.avg_time_per_token))
-        self.cur_pos += 1
-        if self.cur_pos >= len(self.trace):
+        node = await self._next_step()
+        if node is None:
             self.finished = True
+            return
+        self._move_to(node)
+        self._post_node(node)
+        if node.terminal:
+            self.finished = True
+
+    def step_back(self):
+        """Move to the parent step without recomputing anything."""
+        if self.cur_node is None or self.cur_node.parent is None:
+            return
+        self.cur_node = self.cur_node.parent
+        self.finished = False
+        self._post_node(self.cur_node)
+
+    def branch(self, rank=None):
+        """Replace the current step's token with the candidate at `rank`.
+
+        Without a rank, pick the most probable other candidate after applying the
+        recurrence penalty for continuations that were already explored.
+        """
+        node = self.cur_node
+        if node is None or node.parent is None or not node.candidates:
+            return
+        parent = node.parent
+        candidates = node.candidates
+        shown = min(len(candidates), 10)
+        if rank is None:
+            probs = candidates.probs
+            def score(i):
+                sibling = parent.children.get(candidates.ids[i])
+                visits = sibling.visits if sibling is not None else 0
+                return probs[i] * (1 - _RECURRENCE_PENALTY) ** visits
+            others = [i for i in range(shown) if candidates.ids[i] != node.token_id]
+            if not others:
+                return
+            choice = max(others, key=score)
+        elif 0 <= rank < shown:
+            choice = rank
+        else:
+            self.notify(f"Alt # must be between 1 and {shown}", severity="error")
+            return
+        token_id = candidates.ids[choice]
+        # Candidate labels are single-token decodes; ask the model for the text it adds in context
+        token = self.model.decode_delta(self._node_tokens(parent), token_id)
+        sibling = parent.add_child(token_id, token, candidates)
+        self._move_to(sibling)
+        self.finished = False
+        self._post_node(sibling)
+
+    def _build_panels(self, node, cur_pos, total_steps, total_time, avg_time_per_token):
+        """Build the renderables for one update; safe to run off the event loop."""
+        candidates = node.candidates
+        probs = candidates.probs[:10]
+        max_prob = probs[0] if probs else 1.0
+
+        # Only the timing and step lines change between updates
+        metrics_text = Text(self._metrics_static)
+        metrics_text.append(f"Total Time: {total_time:.2f} sec\n"
+                            f"Avg Token Time: {avg_time_per_token*1000:.1f} ms\n"
+                            f"Steps: {cur_pos + 1}/{total_steps}\n")
+        return (_render_tokens_panel(candidates.tokens[:10], probs, max_prob),
+                _render_generated_panel(node),
+                metrics_text)
 
     async def on_token_update(self, message: TokenUpdate):
         """Handle UI updates from the worker."""
-        step_info = message.step_info
-        cur_pos = message.cur_pos
-        total_steps = message.total_steps
-        total_time = message.total_time
-        avg_time_per_token = message.avg_time_per_token
-
-        tokens_panel = self.query_one("#tokens", Static)
-        gen_panel = self.query_one("#generated", Static)
-        metrics_panel = self.query_one("#metrics", Static)
-
-        token_text = Text("", justify="left")
-        max_prob = step_info["top_tokens"][0]['prob'] if step_info["top_tokens"] else 1.0
-        for tok_info in step_info["top_tokens"][:10]:
-            token = tok_info['token']
-            prob = tok_info['prob']
-            width = int(prob / max_prob * 30)
-            bar = "█" * width
-            token_text.append(token.ljust(12), style="bold blue")
-            token_text.append(" | ")
-            token_text.append(bar.ljust(30))
-            token_text.append(f" {prob:.4f}\n")
-
-        tokens_panel.update(Panel(token_text, title="Top Candidates", border_style="cyan"))
-        gen_panel.update(Panel(Text(step_info['current_text'], style="bold green"), 
-                              title="Generated Text", border_style="green"))
-
-        metrics_text = Text()
-        metrics_text.append(f"Model: {self.model.model_name}\n")
-
-        metrics_text.append(f"Total Time: {total_time:.2f} sec\n")
-        metrics_text.append(f"Avg Token Time: {avg_time_per_token*1000:.1f} ms\n")
-        metrics_text.append(f"Strategy: {self.decoding_strategy}\n")
-        metrics_text.append(f"Steps: {cur_pos + 1}/{total_steps}\n")
-        metrics_panel.update(Panel(metrics_text, title="Metrics 📈", border_style="magenta"))
+        # Nodes are immutable once shown, so re-posting the same one changes nothing on screen
+        if message.node is self._last_rendered_node:
+            return
+        self._last_rendered_node = message.node
+        # Text styling and formatting happen on a thread; the loop only swaps in the results
+        tokens_panel, gen_panel, metrics_text = await asyncio.get_running_loop().run_in_executor(
+            None, self._build_panels, message.node, message.cur_pos, message.total_steps,
+            message.total_time, message.avg_time_per_token)
+
+        self._tokens_panel.update(tokens_panel)
+        self._gen_panel.update(gen_panel)
+        self._metrics_box.renderable = metrics_text
+        self._metrics_panel.update(self._metrics_box)
 
 if __name__ == "__main__":
     # Replace with your model initialization
     class DummyModel:
-        async def generate_full_trace(self, prompt, max_steps, temperature, top_p, top_k, decoding_strategy):
-            return [{"top_tokens": [{"token": "test", "prob": 0.9}], "current_text": "test"}] * 5
+        model_name = "dummy"
+
+        def tokenize(self, prompt):
+            return [ord(c) for c in prompt]
+
+        def decode_delta(self, path_ids, token_id):
+            return "test"
+
+        async def stream_trace(self, prompt_tokens, max_steps, temperature, top_p, top_k, decoding_strategy,
+                               cached_prefix_len=0, cache_handle=None):
+            for _ in range(5):
+                yield {"top_tokens": [{"token": "test", "prob": 0.9, "id": 0}], "chosen_token": "test", "token_id": 0}
 
     app = DecodeTUI(model=DummyModel())
     app.run()
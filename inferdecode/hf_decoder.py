@@ -1,9 +1,43 @@
 # hf_decoder.py (updated implementation)
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from inferdecode.base_decoder import BaseDecoder
 from huggingface_hub import login
 
+try:
+    from transformers import DynamicCache
+except ImportError:  # transformers < 4.36 passes caches around as tuples
+    DynamicCache = None
+
+# Marks the end of the step stream handed from the generation thread to the event loop
+_DONE = object()
+
+# Steps the generation thread may run ahead of the consumer before it waits
+_STREAM_BUFFER = 8
+
+
+def _past_layers(past):
+    """Return the per-layer (key, value) tensors held by a cache object or legacy tuple."""
+    if hasattr(past, "layers"):
+        return tuple((layer.keys, layer.values) for layer in past.layers)
+    if hasattr(past, "key_cache"):
+        return tuple(zip(past.key_cache, past.value_cache))
+    return tuple(tuple(layer[:2]) for layer in past)
+
+
+def _restore_past(layers, length):
+    """Build a fresh cache holding the first `length` positions of `layers`."""
+    cropped = tuple((k[:, :, :length, :], v[:, :, :length, :]) for k, v in layers)
+    if DynamicCache is None:
+        return cropped
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(cropped)
+    return DynamicCache(cropped)
+
 
 class HFDecoder(BaseDecoder):
     def __init__(self, model_name: str, device="cuda"):
@@ -15,24 +49,99 @@ class HFDecoder(BaseDecoder):
         self.model.to(device)
         self.model.eval()
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Torch releases the GIL, so a single worker thread keeps the caller's event loop free
+        self._executor = ThreadPoolExecutor(max_workers=1)
 
     @property
     def model_name(self) -> str:
         return self.model.name_or_path
 
-    async def generate_full_trace(self, prompt, max_steps, temperature, top_p, top_k, decoding_strategy):
-        trace = []
-        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.device)
-        generated = input_ids.clone()
+    def tokenize(self, prompt):
+        return self.tokenizer(prompt).input_ids
+
+    def decode_delta(self, path_ids, token_id):
+        # Same rule as stream_trace_sync: an incomplete trailing byte sequence is held back
+        prefix = self.tokenizer.decode(path_ids).rstrip("\ufffd")
+        text = self.tokenizer.decode(list(path_ids) + [token_id])
+        return "" if text.endswith("\ufffd") else text[len(prefix):]
+
+    def _prefill(self, input_ids, cached_prefix_len, cache_handle):
+        """Run the prompt through the model, reusing cached attention states for a shared prefix."""
+        reuse = 0
+        if cache_handle is not None and cached_prefix_len > 0:
+            # Keep at least one prompt token to feed forward so we get next-token logits
+            reuse = min(cached_prefix_len, input_ids.size(1) - 1)
+
+        if reuse > 0:
+            past = _restore_past(cache_handle, reuse)
+            outputs = self.model(input_ids=input_ids[:, reuse:], past_key_values=past, use_cache=True)
+        else:
+            outputs = self.model(input_ids=input_ids, use_cache=True)
+        # Dynamic caches grow by concatenating into new tensors, so the prompt's tensors are
+        # never written again and the handle can share them instead of copying the cache
+        return outputs, _past_layers(outputs.past_key_values)
+
+    async def stream_trace(self, prompt_tokens, max_steps, temperature, top_p, top_k, decoding_strategy,
+                           cached_prefix_len=0, cache_handle=None):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        # Free buffer slots; the thread blocks here when the consumer falls behind
+        slots = threading.Semaphore(_STREAM_BUFFER)
+
+        def produce():
+            try:
+                for step_info in self.stream_trace_sync(prompt_tokens, max_steps, temperature, top_p, top_k,
+                                                        decoding_strategy, cached_prefix_len, cache_handle):
+                    # Poll so an abandoned stream doesn't park the worker thread forever
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, step_info)
+            except Exception as exc:
+                loop.call_soon_threadsafe(queue.put_nowait, exc)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+        loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                slots.release()
+                yield item
+        finally:
+            # Let the generation thread stop after its current step if we are closed early
+            stop.set()
+
+    def stream_trace_sync(self, prompt_tokens, max_steps, temperature, top_p, top_k, decoding_strategy,
+                          cached_prefix_len=0, cache_handle=None):
+        """Blocking generator yielding one step dict per decoding step."""
+        input_ids = torch.tensor([prompt_tokens], dtype=torch.long, device=self.device)
+        past = None
+        # Decode incrementally like TextStreamer: each step emits the text the whole sequence gained.
+        # A trailing replacement char is an incomplete byte sequence, released once it completes.
+        text_ids = list(prompt_tokens)
+        emitted = len(self.tokenizer.decode(text_ids).rstrip("\ufffd"))
 
         # Validate parameters
         top_p = max(0.0, min(1.0, top_p))
         top_k = max(1, top_k)
         temperature = max(0.0, temperature)
 
-        for _ in range(max_steps):
+        for step in range(max_steps):
+            start_time = time.perf_counter()
             with torch.no_grad():
-                outputs = self.model(input_ids=generated)
+                if past is None:
+                    outputs, cache_handle = self._prefill(input_ids, cached_prefix_len, cache_handle)
+                else:
+                    outputs = self.model(input_ids=next_token.unsqueeze(0), past_key_values=past, use_cache=True)
+                past = outputs.past_key_values
                 logits = outputs.logits[:, -1, :]
 
             # Apply temperature
@@ -113,22 +222,26 @@ class HFDecoder(BaseDecoder):
             else:
                 raise ValueError(f"Unknown decoding strategy {decoding_strategy}")
 
-            token_str = self.tokenizer.decode(next_token[0])
-            full_text = self.tokenizer.decode(torch.cat([generated[0], next_token]).tolist())
+            text_ids.append(next_token.item())
+            text = self.tokenizer.decode(text_ids)
+            if text.endswith("\ufffd"):
+                token_str = ""
+            else:
+                token_str = text[emitted:]
+                emitted = len(text)
 
-            trace.append({
-                "step": len(trace) + 1,
+            yield {
+                "step": step + 1,
                 "top_tokens": [
-                    {"token": self.tokenizer.decode([idx.item()]), "prob": prob.item()}
+                    {"token": self.tokenizer.decode([idx.item()]), "prob": prob.item(), "id": idx.item()}
                     for idx, prob in zip(top_indices[0], top_probs[0])
                 ],
                 "chosen_token": token_str,
-                "current_text": full_text
-            })
-
-            generated = torch.cat([generated, next_token.unsqueeze(0)], dim=-1)
+                "token_id": next_token.item(),
+                "cache_handle": cache_handle,
+                # Measured here because the consumer only sees how long it waited on the queue
+                "step_time": time.perf_counter() - start_time
+            }
 
             if next_token.item() == self.tokenizer.eos_token_id:
                 break
-
-        return trace